@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Header
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import Session
 from typing import Dict, Any, Optional, Union
@@ -18,6 +18,7 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 @router.post("/register", response_model=Dict[str, Any], status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: UserCreate,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     """
@@ -29,7 +30,7 @@ async def register(
     - **age**: Edad (opcional)
     - **gender**: Género (opcional)
     """
-    result = await AuthService.register(session, user_data)
+    result = await AuthService.register(session, user_data, background_tasks)
     return {
         "message": result["message"],
         "user": UserRead.model_validate(result["user"])
@@ -121,6 +122,7 @@ async def verify_email(
 @router.post("/resend-activation", response_model=Dict[str, str])
 async def resend_activation(
     email: str,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     """
@@ -128,12 +130,13 @@ async def resend_activation(
     
     - **email**: Email de la cuenta
     """
-    return await AuthService.resend_activation_email(session, email)
+    return await AuthService.resend_activation_email(session, email, background_tasks)
 
 
 @router.post("/request-password-reset", response_model=Dict[str, str])
 async def request_password_reset(
     email: str,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     """
@@ -143,11 +146,11 @@ async def request_password_reset(
     
     Envía un email con el link de reset
     """
-    return await AuthService.request_password_reset(session, email)
+    return await AuthService.request_password_reset(session, email, background_tasks)
 
 
 @router.post("/reset-password", response_model=Dict[str, str])
-def reset_password(
+async def reset_password(
     reset_data: UserResetPassword,
     session: Session = Depends(get_session)
 ):
@@ -157,7 +160,7 @@ def reset_password(
     - **token**: Token de reset recibido por email
     - **new_password**: Nueva contraseña
     """
-    return AuthService.reset_password(session, reset_data.token, reset_data.new_password)
+    return await AuthService.reset_password(session, reset_data.token, reset_data.new_password)
 
 
 @router.post("/refresh", response_model=Token)
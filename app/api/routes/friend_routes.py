@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, status
 from sqlmodel import Session
 from typing import List
 from app.db import get_session
-from app.services import FriendService
+from app.services import FriendService, UserService
 from app.models import (
     User, Friend, FriendRead, FriendRequestCreate, 
     FriendRequestResponse
@@ -27,13 +27,15 @@ def get_my_friends(
     
     friends = FriendService.get_friends(session, current_user.id)
     
-    # Enrich with user data
+    # Determine which user is the friend
+    friend_ids = [
+        friend.receiver_id if friend.requester_id == current_user.id else friend.requester_id
+        for friend in friends
+    ]
+    
+    # Enrich with user data (one query for all friends)
     result = []
-    for friend in friends:
-        # Determine which user is the friend
-        friend_id = friend.receiver_id if friend.requester_id == current_user.id else friend.requester_id
-        friend_user = session.get(User, friend_id)
-        
+    for friend, friend_user in zip(friends, UserService.list_by_ids(session, friend_ids)):
         if friend_user:
             result.append({
                 "id": friend.id,
@@ -69,9 +71,9 @@ def get_pending_requests(
     pending = FriendService.get_pending_requests(session, current_user.id)
     
     # Enrich received requests with user data
+    requesters = UserService.list_by_ids(session, [req.requester_id for req in pending["received"]])
     received_enriched = []
-    for req in pending["received"]:
-        requester = session.get(User, req.requester_id)
+    for req, requester in zip(pending["received"], requesters):
         if requester:
             received_enriched.append({
                 "id": str(req.id),  # Convert to string
@@ -89,9 +91,9 @@ def get_pending_requests(
             })
     
     # Enrich sent requests with user data
+    receivers = UserService.list_by_ids(session, [req.receiver_id for req in pending["sent"]])
     sent_enriched = []
-    for req in pending["sent"]:
-        receiver = session.get(User, req.receiver_id)
+    for req, receiver in zip(pending["sent"], receivers):
         if receiver:
             sent_enriched.append({
                 "id": str(req.id),  # Convert to string
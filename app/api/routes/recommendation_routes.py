@@ -34,7 +34,7 @@ async def get_my_recommendations(
     """
     try:
         recommendation_service = RecommendationService()
-        recommendations = recommendation_service.generate_recommendations(
+        recommendations = await recommendation_service.generate_recommendations(
             session=session,
             user_id=current_user.id,
             count=count
@@ -68,7 +68,7 @@ async def get_user_recommendations(
     """
     try:
         recommendation_service = RecommendationService()
-        recommendations = recommendation_service.generate_recommendations(
+        recommendations = await recommendation_service.generate_recommendations(
             session=session,
             user_id=user_id,
             count=count
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select, col
-from typing import List
-from app.db import get_session
+from typing import List, Iterator, Optional
+import csv
+import io
+from enum import Enum
+from app.db import get_session, engine
 from app.services import UserService
 from app.models import (
     User, UserRead, UserReadPrivate, UserUpdate, 
@@ -111,18 +115,26 @@ def search_users(
     
     users = session.exec(statement).all()
     
-    # Add friendship status for each user
-    results = []
-    for user in users:
-        # Check friendship status
-        friendship = session.exec(
+    # Load the current user's friendships with all results in one query
+    user_ids = [user.id for user in users]
+    friendships = {}
+    if user_ids:
+        friend_rows = session.exec(
             select(Friend).where(
                 (
-                    ((Friend.requester_id == current_user.id) & (Friend.receiver_id == user.id)) |
-                    ((Friend.requester_id == user.id) & (Friend.receiver_id == current_user.id))
+                    ((Friend.requester_id == current_user.id) & (col(Friend.receiver_id).in_(user_ids))) |
+                    ((col(Friend.requester_id).in_(user_ids)) & (Friend.receiver_id == current_user.id))
                 )
             )
-        ).first()
+        ).all()
+        for friend in friend_rows:
+            other_id = friend.receiver_id if friend.requester_id == current_user.id else friend.requester_id
+            friendships.setdefault(other_id, friend)
+    
+    # Add friendship status for each user
+    results = []
+    for user in users:
+        friendship = friendships.get(user.id)
         
         status = None
         if friendship:
@@ -163,7 +175,7 @@ def update_my_profile(
 
 
 @router.put("/me/password")
-def change_password(
+async def change_password(
     password_data: UserUpdatePassword,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_active_user)
@@ -176,7 +188,7 @@ def change_password(
     
     Requiere autenticación
     """
-    UserService.update_password(session, current_user.id, password_data)
+    await UserService.update_password(session, current_user.id, password_data)
     return {"message": "Password updated successfully"}
 
 
@@ -186,6 +198,7 @@ def change_password(
 @router.post("/me/request-email-change")
 async def request_email_change(
     email_data: EmailChangeRequest,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -209,19 +222,15 @@ async def request_email_change(
         email_data.new_email
     )
     
-    # Enviar email de verificación al nuevo correo
-    email_sent = await send_email_change_verification(
+    # Enviar email de verificación al nuevo correo después de responder;
+    # si no llega, el usuario puede cancelar con /me/cancel-email-change
+    background_tasks.add_task(
+        send_email_change_verification,
         user.pending_email,
         user.username,
         user.email_change_token
     )
     
-    if not email_sent:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to send verification email"
-        )
-    
     return {
         "message": "Verification email sent. Please check your new email to confirm the change.",
         "new_email": user.pending_email,
@@ -232,6 +241,7 @@ async def request_email_change(
 @router.post("/verify-email-change")
 async def verify_email_change(
     verification_data: EmailChangeVerification,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session)
 ):
     """
@@ -253,7 +263,7 @@ async def verify_email_change(
     # Enviar notificación al correo anterior
     old_email = getattr(user, '_old_email', None)
     if old_email:
-        await send_email_changed_notification(old_email, user.username)
+        background_tasks.add_task(send_email_changed_notification, old_email, user.username)
     
     return {
         "message": "Email changed successfully. Your account has been reactivated.",
@@ -364,6 +374,63 @@ def get_all_users(
     return UserService.get_all(session, skip, limit, is_active)
 
 
+USER_EXPORT_FIELDS = [
+    "id", "username", "email", "role", "auth_provider",
+    "is_active", "is_verified", "is_email_activated", "created_at", "last_login"
+]
+
+
+# Prefijos que Excel/Sheets interpretan como fórmula (inyección CSV)
+_CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_cell(value):
+    """Valor seguro para una celda: Enum a su valor y texto con prefijo de fórmula escapado con '"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, str) and value.startswith(_CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _export_users_csv(is_active: Optional[bool] = None) -> Iterator[str]:
+    """Generar el CSV fila a fila con una sesión propia que vive lo que dura el stream"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(USER_EXPORT_FIELDS)
+    
+    with Session(engine) as session:
+        for user in UserService.iter_users(session, is_active=is_active):
+            row = [getattr(user, field) for field in USER_EXPORT_FIELDS]
+            writer.writerow([_csv_cell(value) for value in row])
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    
+    yield buffer.getvalue()
+
+
+@router.get("/export/csv")
+def export_users_csv(
+    is_active: Optional[bool] = None,
+    admin_user: User = Depends(get_admin_user)
+):
+    """
+    Exportar todos los usuarios en CSV (solo admin)
+    
+    - **is_active**: Filtrar por estado activo (opcional)
+    
+    Se envía en streaming, sin cargar todos los usuarios en memoria.
+    Requiere rol de administrador
+    """
+    return StreamingResponse(
+        _export_users_csv(is_active),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=users.csv"}
+    )
+
+
 @router.delete("/{user_id}")
 def delete_user_admin(
     user_id: int,
@@ -6,17 +6,22 @@ from .config import settings, Settings
 from .security import (
     hash_password,
     verify_password,
+    hash_password_async,
+    verify_password_async,
+    get_hash_executor,
+    shutdown_hash_executor,
     validate_password_strength,
+    configure_password_hashing,
     create_access_token,
     create_refresh_token,
     decode_token,
     generate_verification_token,
     generate_reset_password_token,
+    hash_token,
     generate_otp_code,
     generate_device_token,
     Token,
-    TokenData,
-    pwd_context
+    TokenData
 )
 from .auth import (
     get_current_user,
@@ -54,17 +59,22 @@ __all__ = [
     # Security
     "hash_password",
     "verify_password",
+    "hash_password_async",
+    "verify_password_async",
+    "get_hash_executor",
+    "shutdown_hash_executor",
     "validate_password_strength",
+    "configure_password_hashing",
     "create_access_token",
     "create_refresh_token",
     "decode_token",
     "generate_verification_token",
     "generate_reset_password_token",
+    "hash_token",
     "generate_otp_code",
     "generate_device_token",
     "Token",
     "TokenData",
-    "pwd_context",
     
     # Auth Dependencies
     "get_current_user",
@@ -1,6 +1,6 @@
 from fastapi import Depends, HTTPException, status, Header
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
-from sqlmodel import Session, select
+from sqlmodel import Session
 from typing import Optional
 from app.core.security import decode_token, TokenData
 from app.core.config import settings
@@ -66,9 +66,9 @@ async def get_current_user(
     if user_id is None:
         raise credentials_exception
     
-    # Buscar usuario en la base de datos
-    statement = select(User).where(User.id == int(user_id))
-    user = session.exec(statement).first()
+    # Buscar usuario (queda en la caché de la petición para los servicios)
+    from app.services.user_service import UserService
+    user = UserService.get_by_id(session, int(user_id))
     
     if user is None:
         raise credentials_exception
@@ -28,6 +28,9 @@ class Settings(BaseSettings):
     PASSWORD_REQUIRE_LOWERCASE: bool = True
     PASSWORD_REQUIRE_DIGIT: bool = True
     PASSWORD_REQUIRE_SPECIAL: bool = False
+    BCRYPT_ROUNDS: Optional[int] = None  # Si no se define, se calibra al arrancar
+    BCRYPT_TARGET_MS: int = 300  # Tiempo objetivo por hash en la calibración
+    HASH_WORKERS: Optional[int] = None  # Hilos para bcrypt (por defecto, núcleos del host)
     
 
     BACKEND_URL: Optional[str] = None  # URL del backend para enlaces en correos electrónicos
@@ -1,3 +1,4 @@
+import asyncio
 import smtplib
 import logging
 from email.mime.text import MIMEText
@@ -115,6 +116,14 @@ def get_email_template(title: str, content: str, button_text: str = None, button
     """
 
 
+def _deliver(msg: MIMEMultipart) -> None:
+    """Entregar el mensaje al servidor SMTP (bloqueante)"""
+    with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as s:
+        s.starttls()
+        s.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        s.send_message(msg)
+
+
 async def send_email(to_email: str, subject: str, body: str, html_body: str = None) -> bool:
     if not all([settings.SMTP_HOST, settings.SMTP_USER, settings.SMTP_PASSWORD, settings.SMTP_FROM_EMAIL]):
         logger.warning("SMTP not configured")
@@ -133,10 +142,8 @@ async def send_email(to_email: str, subject: str, body: str, html_body: str = No
         if html_body:
             msg.attach(MIMEText(html_body, "html"))
         
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as s:
-            s.starttls()
-            s.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            s.send_message(msg)
+        # smtplib es bloqueante: la conversación SMTP va en un hilo aparte
+        await asyncio.to_thread(_deliver, msg)
         
         logger.info(f"Email sent to {to_email}")
         return True
@@ -1,15 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Union
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from app.core.config import settings
+import asyncio
+import bcrypt
+import hashlib
+import os
+import re
 import secrets
+import time
 
 
 # =========================
 # PASSWORD HASHING
 # =========================
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Pool acotado para bcrypt: una ráfaga de logins no acapara los hilos del servidor
+_hash_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_hash_executor() -> ThreadPoolExecutor:
+    """
+    Get the bcrypt thread pool, creating it on first use
+    
+    Note:
+        Created lazily (like get_http_client) so a new lifespan in the
+        same process gets a fresh pool after shutdown_hash_executor.
+    """
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(
+            max_workers=settings.HASH_WORKERS or os.cpu_count() or 1,
+            thread_name_prefix="hash"
+        )
+    return _hash_executor
+
+
+def shutdown_hash_executor() -> None:
+    """Wait for in-flight hashes and stop the bcrypt thread pool"""
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True, cancel_futures=True)
+        _hash_executor = None
+
+
+# La calibración nunca baja del costo por defecto que usaba passlib
+BCRYPT_MIN_ROUNDS = 12
+BCRYPT_MAX_ROUNDS = 14
+# Costos que acepta bcrypt.gensalt (solo para BCRYPT_ROUNDS explícito)
+BCRYPT_VALID_ROUNDS = (4, 31)
+
+# Costo usado por hash_password (lo ajusta configure_password_hashing al arrancar)
+_bcrypt_rounds = 12
+
+
+def _bcrypt_input(password: str) -> bytes:
+    """
+    Encode a password for bcrypt
+    
+    Note:
+        Bcrypt has a 72-byte limit. Passwords are truncated without
+        splitting a UTF-8 character, same as the previous passlib path,
+        so existing hashes keep verifying.
+    """
+    password_bytes = password.encode('utf-8')
+    if len(password_bytes) > 72:
+        password_bytes = password_bytes[:72].decode('utf-8', errors='ignore').encode('utf-8')
+    return password_bytes
+
+
+def calibrate_bcrypt_rounds(target_ms: int) -> int:
+    """
+    Find the highest bcrypt cost that hashes within target_ms on this host
+    
+    Args:
+        target_ms: Target time per hash in milliseconds
+        
+    Returns:
+        Number of rounds between BCRYPT_MIN_ROUNDS and BCRYPT_MAX_ROUNDS
+    
+    Note:
+        Each extra round doubles the work, so a single timing at the
+        minimum cost is enough to extrapolate the rest.
+    """
+    start = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=BCRYPT_MIN_ROUNDS))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    rounds = BCRYPT_MIN_ROUNDS
+    while rounds < BCRYPT_MAX_ROUNDS and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms *= 2
+    
+    return rounds
+
+
+def configure_password_hashing() -> int:
+    """
+    Set the bcrypt cost used by hash_password
+    
+    Uses settings.BCRYPT_ROUNDS when defined, otherwise calibrates
+    against settings.BCRYPT_TARGET_MS. Calibration never goes below
+    BCRYPT_MIN_ROUNDS; only an explicit BCRYPT_ROUNDS can. Existing hashes keep verifying
+    because bcrypt stores the cost inside each hash.
+    
+    Returns:
+        Number of rounds configured
+    
+    Raises:
+        ValueError: If BCRYPT_ROUNDS is outside the range bcrypt accepts
+    """
+    global _bcrypt_rounds
+    if settings.BCRYPT_ROUNDS is not None:
+        if not BCRYPT_VALID_ROUNDS[0] <= settings.BCRYPT_ROUNDS <= BCRYPT_VALID_ROUNDS[1]:
+            raise ValueError(
+                f"BCRYPT_ROUNDS must be between {BCRYPT_VALID_ROUNDS[0]} and "
+                f"{BCRYPT_VALID_ROUNDS[1]}, got {settings.BCRYPT_ROUNDS}"
+            )
+        _bcrypt_rounds = settings.BCRYPT_ROUNDS
+    else:
+        _bcrypt_rounds = calibrate_bcrypt_rounds(settings.BCRYPT_TARGET_MS)
+    return _bcrypt_rounds
 
 
 def hash_password(password: str) -> str:
@@ -25,13 +136,8 @@ def hash_password(password: str) -> str:
     Note:
         Bcrypt has a 72-byte limit. Passwords are truncated if necessary.
     """
-    # Bcrypt has a 72-byte password limit, truncate if needed
-    password_bytes = password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password_bytes = password_bytes[:72]
-        password = password_bytes.decode('utf-8', errors='ignore')
-    
-    return pwd_context.hash(password)
+    hashed = bcrypt.hashpw(_bcrypt_input(password), bcrypt.gensalt(rounds=_bcrypt_rounds))
+    return hashed.decode('utf-8')
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -45,18 +151,51 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     Returns:
         True if password matches, False otherwise
     """
-    # Bcrypt has a 72-byte password limit, truncate if needed
-    password_bytes = plain_password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password_bytes = password_bytes[:72]
-        plain_password = password_bytes.decode('utf-8', errors='ignore')
+    # checkpw compara el hash resultante en tiempo constante
+    try:
+        return bcrypt.checkpw(_bcrypt_input(plain_password), hashed_password.encode('utf-8'))
+    except ValueError:
+        # Hash con formato inválido
+        return False
+
+
+async def hash_password_async(password: str) -> str:
+    """
+    Hash a password in the bcrypt pool without blocking the event loop
     
-    return pwd_context.verify(plain_password, hashed_password)
+    Args:
+        password: Plain text password
+        
+    Returns:
+        Hashed password
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_hash_executor(), hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify a password in the bcrypt pool without blocking the event loop
+    
+    Args:
+        plain_password: Plain text password to verify
+        hashed_password: Hashed password from database
+        
+    Returns:
+        True if password matches, False otherwise
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_hash_executor(), verify_password, plain_password, hashed_password)
 
 
 # =========================
 # PASSWORD VALIDATION
 # =========================
+# Compiled once at import; validate_password_strength runs on every signup/reset
+_HAS_DIGIT = re.compile(r"\d")
+_HAS_SPECIAL = re.compile(r"[!@#$%^&*()_+\-=\[\]{}|;:,.<>?]")
+
+
 def validate_password_strength(password: str) -> tuple[bool, str]:
     """
     Validate password strength based on settings
@@ -70,16 +209,17 @@ def validate_password_strength(password: str) -> tuple[bool, str]:
     if len(password) < settings.PASSWORD_MIN_LENGTH:
         return False, f"Password must be at least {settings.PASSWORD_MIN_LENGTH} characters long"
     
-    if settings.PASSWORD_REQUIRE_UPPERCASE and not any(c.isupper() for c in password):
+    # Case checks via lower()/upper() keep Unicode letters (e.g. "Ñ") working
+    if settings.PASSWORD_REQUIRE_UPPERCASE and password.lower() == password:
         return False, "Password must contain at least one uppercase letter"
     
-    if settings.PASSWORD_REQUIRE_LOWERCASE and not any(c.islower() for c in password):
+    if settings.PASSWORD_REQUIRE_LOWERCASE and password.upper() == password:
         return False, "Password must contain at least one lowercase letter"
     
-    if settings.PASSWORD_REQUIRE_DIGIT and not any(c.isdigit() for c in password):
+    if settings.PASSWORD_REQUIRE_DIGIT and not _HAS_DIGIT.search(password):
         return False, "Password must contain at least one digit"
     
-    if settings.PASSWORD_REQUIRE_SPECIAL and not any(c in "!@#$%^&*()_+-=[]{}|;:,.<>?" for c in password):
+    if settings.PASSWORD_REQUIRE_SPECIAL and not _HAS_SPECIAL.search(password):
         return False, "Password must contain at least one special character"
     
     return True, ""
@@ -188,6 +328,19 @@ def generate_reset_password_token() -> str:
     return secrets.token_urlsafe(32)
 
 
+def hash_token(token: str) -> str:
+    """
+    Hash a verification/reset token for storage and lookup
+    
+    Args:
+        token: Raw token sent to the user
+        
+    Returns:
+        SHA-256 hex digest of the token
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
 def generate_otp_code() -> str:
     """
     Generate a 6-digit OTP code
@@ -1,16 +1,25 @@
 from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy.schema import CreateIndex
 from typing import Generator
 import os
 
 # Obtener la URL de la base de datos desde variables de entorno
 DATABASE_URL = os.getenv("DATABASE_URL", "")
 
+# Tamaño del pool: el default (5 + 10) se agota en cuanto hay carga concurrente
+POOL_OPTIONS = {} if DATABASE_URL.startswith("sqlite") else {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),  # Segundos esperando conexión libre
+}
+
 # Configuración del engine
 engine = create_engine(
     DATABASE_URL, 
     echo=os.getenv("DB_ECHO", "false").lower() == "true",
     pool_pre_ping=True,  # Verificar conexión antes de usar
     pool_recycle=300,    # Reciclar conexiones cada 5 minutos
+    **POOL_OPTIONS,
 )
 
 
@@ -22,11 +31,22 @@ def init_db():
         CommentUser, CommentLike, Store, Friend
     )
     SQLModel.metadata.create_all(engine)
+    
+    # create_all no agrega índices nuevos a tablas que ya existen.
+    # IF NOT EXISTS en lugar de checkfirst: la reflexión no ve los índices por expresión.
+    # Los únicos se saltan: sobre datos existentes pueden fallar y los crea
+    # app.db.migrations después de limpiar duplicados
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                if not index.unique:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
  
 
 def get_session() -> Generator[Session, None, None]:
     """Dependency para obtener una sesión de base de datos"""
-    with Session(engine) as session:
+    # Sin expirar en commit: los objetos ya tienen sus valores y no hace falta refresh()
+    with Session(engine, expire_on_commit=False) as session:
         yield session
 
 
@@ -0,0 +1,107 @@
+"""
+Migraciones de datos puntuales. Se ejecutan a mano antes de desplegar, nunca al arrancar:
+
+    python -m app.db.migrations
+
+init_db solo crea tablas e índices no únicos. Los índices únicos sobre tablas
+que ya existen se crean aquí, después de limpiar los datos que los romperían.
+Todos los pasos son idempotentes: volver a ejecutarlo no cambia nada.
+"""
+import logging
+import sys
+from sqlalchemy import and_, delete, exists, func, or_, select, update
+from sqlalchemy.schema import CreateIndex
+from sqlmodel import SQLModel
+from app.db.database import engine, init_db
+
+logger = logging.getLogger(__name__)
+
+
+def delete_duplicates(table_name: str, keys: list[str], newest_by: str) -> int:
+    """
+    Borrar filas repetidas por keys dejando la más reciente según newest_by
+    (a igualdad, la de id mayor). Retorna cuántas filas se borraron.
+    """
+    table = SQLModel.metadata.tables[table_name]
+    newer = table.alias()
+    statement = delete(table).where(
+        exists().where(
+            *[newer.c[key] == table.c[key] for key in keys],
+            or_(
+                newer.c[newest_by] > table.c[newest_by],
+                and_(newer.c[newest_by] == table.c[newest_by], newer.c.id > table.c.id)
+            )
+        )
+    )
+    with engine.begin() as connection:
+        deleted = connection.execute(statement).rowcount
+    if deleted:
+        logger.info("%s: %s filas duplicadas borradas", table_name, deleted)
+    return deleted
+
+
+def normalize_user_emails() -> bool:
+    """
+    Pasar los emails a minúsculas y quitar el índice ix_users_email_lower (reemplazado
+    por ux_users_email_lower).
+    Si hay cuentas cuyo email solo difiere en mayúsculas no toca nada y las reporta:
+    hay que fusionarlas o cambiar uno de los emails a mano. Retorna False en ese caso.
+    """
+    users = SQLModel.metadata.tables["users"]
+    lowered = func.lower(users.c.email)
+
+    with engine.connect() as connection:
+        duplicates = connection.execute(
+            select(users.c.id, users.c.email)
+            .where(lowered.in_(select(lowered).group_by(lowered).having(func.count() > 1)))
+            .order_by(lowered, users.c.id)
+        ).all()
+
+    if duplicates:
+        for row in duplicates:
+            logger.error("Email duplicado salvo mayúsculas: id=%s email=%s", row.id, row.email)
+        return False
+
+    # Escritura y DDL en transacciones separadas: CockroachDB no admite DDL tras escrituras
+    with engine.begin() as connection:
+        result = connection.execute(
+            update(users).where(users.c.email != lowered).values(email=lowered)
+        )
+        logger.info("Emails pasados a minúsculas: %s", result.rowcount)
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX IF EXISTS ix_users_email_lower")
+
+    return True
+
+
+def create_unique_indexes(skip: set[str]) -> None:
+    """Crear los índices únicos del modelo que falten (los nombrados en skip no)"""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.unique and index.name not in skip:
+                with engine.begin() as connection:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def run() -> bool:
+    """Ejecutar todos los pasos. Retorna False si alguno quedó pendiente"""
+    init_db()
+
+    # Restos del antiguo "consultar y luego insertar" en add_trusted_device...
+    delete_duplicates("trusted_devices", ["user_id", "device_id"], newest_by="last_used_at")
+    # ... y en add_to_wishlist
+    delete_duplicates("wishlists", ["user_id", "game_id"], newest_by="added_at")
+
+    skip = set()
+    emails_ok = normalize_user_emails()
+    if not emails_ok:
+        skip.add("ux_users_email_lower")
+
+    create_unique_indexes(skip)
+    return emails_ok
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if run() else 1)
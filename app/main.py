@@ -1,20 +1,56 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from dotenv import load_dotenv
+from sqlmodel import Session
+import asyncio
+import logging
 
 # Cargar variables de entorno
 load_dotenv()
 
-from app.db import init_db
-from app.core import settings
+from app.db import init_db, engine
+from app.core import settings, configure_password_hashing, shutdown_hash_executor
+from app.services import OTPService
+from app.services.recommendation_service import close_http_client
+
+# En producción los logs de depuración quedan desactivados (nivel INFO)
+logging.basicConfig(level=logging.DEBUG if settings.DEBUG else logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se eliminan los OTPs expirados
+OTP_CLEANUP_INTERVAL_SECONDS = 60
+
+
+def _cleanup_expired_otps() -> int:
+    """Eliminar OTPs expirados con una sesión propia"""
+    with Session(engine) as session:
+        return OTPService.cleanup_expired_otps(session)
+
+
+async def cleanup_expired_otps_periodically():
+    """Tarea de fondo que limpia los OTPs expirados fuera del ciclo de las peticiones"""
+    while True:
+        await asyncio.sleep(OTP_CLEANUP_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(_cleanup_expired_otps)
+        except Exception:
+            logger.exception("OTP cleanup error")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Inicializar la base de datos al arrancar la app"""
+    """Inicializar la base de datos al arrancar la app y liberar recursos al apagarla"""
     init_db()
+    rounds = await asyncio.to_thread(configure_password_hashing)
+    logger.info("bcrypt rounds: %s", rounds)
+    cleanup_task = asyncio.create_task(cleanup_expired_otps_periodically())
     yield
+    cleanup_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await cleanup_task
+    await close_http_client()
+    await asyncio.to_thread(shutdown_hash_executor)
 
 
 app = FastAPI(
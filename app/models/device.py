@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index, text
 from typing import Optional
 from datetime import datetime, timezone
 
@@ -6,6 +7,10 @@ from datetime import datetime, timezone
 class TrustedDevice(SQLModel, table=True):
     """Modelo para dispositivos de confianza del usuario"""
     __tablename__ = "trusted_devices"
+    __table_args__ = (
+        # Un registro por dispositivo y usuario (clave del upsert)
+        Index("ux_trusted_devices_user_device", "user_id", "device_id", unique=True),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.id", index=True)
@@ -24,6 +29,16 @@ class TrustedDevice(SQLModel, table=True):
 class OTPCode(SQLModel, table=True):
     """Modelo para almacenar códigos OTP temporales"""
     __tablename__ = "otp_codes"
+    __table_args__ = (
+        # Índice parcial: verify_otp solo consulta OTPs no usados
+        Index(
+            "ix_otp_codes_active",
+            "user_id",
+            "purpose",
+            text("created_at DESC"),
+            postgresql_where=text("is_used = false"),
+        ),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.id", index=True)
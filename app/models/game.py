@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, text
 from typing import Optional, List
 from datetime import datetime, timezone
 
@@ -18,6 +19,14 @@ class GameBase(SQLModel):
 class Game(GameBase, table=True):
     """Modelo de tabla Games en la base de datos"""
     __tablename__ = "games"
+    __table_args__ = (
+        # Índice para el ranking de juegos populares (ORDER BY api_rating DESC)
+        Index(
+            "ix_games_api_rating_desc",
+            text("api_rating DESC"),
+            postgresql_where=text("api_rating IS NOT NULL"),
+        ),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     
@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, text, func
 from typing import Optional, List, TYPE_CHECKING
 from datetime import datetime, timezone
 from enum import Enum
@@ -34,6 +35,12 @@ class UserBase(SQLModel):
 class User(UserBase, table=True):
     """Modelo de tabla Users en la base de datos"""
     __tablename__ = "users"
+    __table_args__ = (
+        # Índices funcionales para búsquedas sin distinguir mayúsculas
+        # (el de email además impide duplicados que solo difieren en mayúsculas)
+        Index("ux_users_email_lower", text("lower(email)"), unique=True),
+        Index("ix_users_username_lower", text("lower(username)")),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     hashed_password: Optional[str] = Field(default=None, max_length=255)
@@ -47,18 +54,23 @@ class User(UserBase, table=True):
     is_verified: bool = Field(default=False)
     is_email_activated: bool = Field(default=False)  # Activación por email
     otp_verified_once: bool = Field(default=False)  # Si ya verificó OTP al menos una vez
-    verification_token: Optional[str] = Field(default=None, max_length=255)
-    reset_password_token: Optional[str] = Field(default=None, max_length=255)
+    # Los tokens se guardan como SHA-256 (ver hash_token), nunca en claro
+    verification_token: Optional[str] = Field(default=None, unique=True, index=True, max_length=255)
+    reset_password_token: Optional[str] = Field(default=None, unique=True, index=True, max_length=255)
     reset_password_expires: Optional[datetime] = Field(default=None)
     
     # Email change fields
     pending_email: Optional[str] = Field(default=None, max_length=255)  # Nuevo email pendiente
-    email_change_token: Optional[str] = Field(default=None, max_length=255)  # Token de confirmación
+    email_change_token: Optional[str] = Field(default=None, unique=True, index=True, max_length=255)  # Token de confirmación
     email_change_expires: Optional[datetime] = Field(default=None)  # Expiración del token
     
     # Timestamps
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        # Sin onupdate: solo los cambios de perfil lo actualizan (no el login ni los tokens)
+        sa_column_kwargs={"server_default": func.now()}
+    )
     last_login: Optional[datetime] = Field(default=None)
     
     # Relationships (se importarán después para evitar circular imports)
@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from typing import Optional
 from datetime import datetime, timezone
 
@@ -16,6 +17,10 @@ class WishListBase(SQLModel):
 class WishList(WishListBase, table=True):
     """Modelo de tabla WishList en la base de datos"""
     __tablename__ = "wishlists"
+    __table_args__ = (
+        # Un juego una sola vez por usuario (clave del ON CONFLICT en add_to_wishlist)
+        Index("ux_wishlists_user_game", "user_id", "game_id", unique=True),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     
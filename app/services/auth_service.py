@@ -1,10 +1,10 @@
 from sqlmodel import Session
 from typing import Optional, Dict, Any, Union
-from fastapi import HTTPException, status
+from fastapi import BackgroundTasks, HTTPException, status
 from datetime import timedelta
 from app.models import User, UserCreate, UserCreateGoogle, OTPVerifyRequest, LoginWithOTPResponse
 from app.core import (
-    verify_password, create_access_token, create_refresh_token,
+    verify_password_async, create_access_token, create_refresh_token,
     Token, verify_google_token, extract_google_user_data,
     send_verification_email, send_welcome_email, send_password_reset_email,
     send_activation_email
@@ -17,21 +17,28 @@ class AuthService:
     """Servicio para operaciones de autenticación"""
     
     @staticmethod
-    async def register(session: Session, user_data: UserCreate) -> Dict[str, Any]:
+    async def register(
+        session: Session,
+        user_data: UserCreate,
+        background_tasks: BackgroundTasks
+    ) -> Dict[str, Any]:
         """
         Registrar nuevo usuario
         
+        El email de activación se envía después de responder (background_tasks)
+        
         Returns:
             Dict con usuario y mensaje
         """
         # Crear usuario (inactivo hasta que active por email)
-        user = UserService.create_user(session, user_data)
+        user = await UserService.create_user(session, user_data)
         
         # Enviar email de activación de cuenta
-        await send_activation_email(
+        background_tasks.add_task(
+            send_activation_email,
             email=user.email,
             username=user.username,
-            activation_token=user.verification_token
+            activation_token=user._activation_token
         )
         
         return {
@@ -74,8 +81,10 @@ class AuthService:
                 detail="Please login with Google"
             )
         
+        UserService._release_connection(session)
+        
         # Verificar contraseña
-        if not verify_password(password, user.hashed_password):
+        if not await verify_password_async(password, user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password"
@@ -300,13 +309,18 @@ class AuthService:
         }
     
     @staticmethod
-    async def resend_activation_email(session: Session, email: str) -> Dict[str, str]:
+    async def resend_activation_email(
+        session: Session,
+        email: str,
+        background_tasks: BackgroundTasks
+    ) -> Dict[str, str]:
         """
         Reenviar email de activación
         
         Args:
             session: Sesión de base de datos
             email: Email del usuario
+            background_tasks: Tareas a ejecutar después de responder (envío del email)
             
         Returns:
             Dict con mensaje
@@ -327,44 +341,55 @@ class AuthService:
         user = UserService.regenerate_activation_token(session, user.id)
         
         # Enviar email de activación
-        await send_activation_email(
+        background_tasks.add_task(
+            send_activation_email,
             email=user.email,
             username=user.username,
-            activation_token=user.verification_token
+            activation_token=user._activation_token
         )
         
         return {"message": "If the email exists, an activation link has been sent."}
     
     @staticmethod
-    async def request_password_reset(session: Session, email: str) -> Dict[str, str]:
+    async def request_password_reset(
+        session: Session,
+        email: str,
+        background_tasks: BackgroundTasks
+    ) -> Dict[str, str]:
         """
         Solicitar reset de contraseña
         
+        El email de reset se envía después de responder (background_tasks)
+        
         Returns:
             Dict con mensaje
         """
+        # Exista o no el email se hace el mismo UPDATE y el envío va después de
+        # responder, así que ambos caminos tardan lo mismo sin relleno artificial
         user = UserService.request_password_reset(session, email)
         
         # Enviar email de reset
-        await send_password_reset_email(
-            email=user.email,
-            username=user.username,
-            reset_token=user.reset_password_token
-        )
+        if user:
+            background_tasks.add_task(
+                send_password_reset_email,
+                email=user.email,
+                username=user.username,
+                reset_token=user._reset_token
+            )
         
         return {
             "message": "If the email exists, a reset link has been sent"
         }
     
     @staticmethod
-    def reset_password(session: Session, token: str, new_password: str) -> Dict[str, str]:
+    async def reset_password(session: Session, token: str, new_password: str) -> Dict[str, str]:
         """
         Resetear contraseña con token
         
         Returns:
             Dict con mensaje
         """
-        UserService.reset_password(session, token, new_password)
+        await UserService.reset_password(session, token, new_password)
         
         return {
             "message": "Password reset successfully"
@@ -1,11 +1,19 @@
-from sqlmodel import Session, select
+import hmac
+from sqlmodel import Session, select, delete, update, or_, func
+from sqlalchemy import exists
+from sqlalchemy.dialects.postgresql import insert
 from typing import Optional, List
 from datetime import datetime, timedelta, timezone
+from cachetools import TTLCache
 from fastapi import HTTPException, status
 from app.models import TrustedDevice, OTPCode, User
 from app.core import generate_otp_code, send_otp_email
 
 
+# Dispositivos cuyo last_used_at ya se actualizó recientemente (1 hora)
+_recently_used_devices: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+
+
 class OTPService:
     """Servicio para operaciones de OTP y dispositivos de confianza"""
     
@@ -13,6 +21,8 @@ class OTPService:
     OTP_EXPIRY_MINUTES = 10
     MAX_OTP_ATTEMPTS = 5
     DEVICE_TRUST_DAYS = 30  # Días que un dispositivo permanece como confianza
+    OTP_EXPIRY = timedelta(minutes=OTP_EXPIRY_MINUTES)
+    DEVICE_TRUST_PERIOD = timedelta(days=DEVICE_TRUST_DAYS)
     
     @staticmethod
     def create_otp(session: Session, user_id: int, purpose: str = "login") -> OTPCode:
@@ -31,11 +41,13 @@ class OTPService:
         OTPService.invalidate_user_otps(session, user_id, purpose)
         
         # Crear nuevo OTP
+        current_time = datetime.now(timezone.utc)
         otp = OTPCode(
             user_id=user_id,
             code=generate_otp_code(),
             purpose=purpose,
-            expires_at=datetime.now(timezone.utc) + timedelta(minutes=OTPService.OTP_EXPIRY_MINUTES)
+            created_at=current_time,
+            expires_at=current_time + OTPService.OTP_EXPIRY
         )
         
         session.add(otp)
@@ -111,8 +123,8 @@ class OTPService:
                 detail="Too many attempts. Please request a new OTP."
             )
         
-        # Verificar código
-        if otp.code != code:
+        # Verificar código (comparación en tiempo constante)
+        if not hmac.compare_digest(otp.code.encode(), code.encode()):
             otp.attempts += 1
             session.commit()
             remaining = OTPService.MAX_OTP_ATTEMPTS - otp.attempts
@@ -167,29 +179,35 @@ class OTPService:
         Returns:
             True si el dispositivo es de confianza
         """
-        statement = select(TrustedDevice).where(
-            TrustedDevice.user_id == user_id,
-            TrustedDevice.device_id == device_id
-        )
-        device = session.exec(statement).first()
+        current_time = datetime.now(timezone.utc)
         
-        if not device:
+        # Consulta EXISTS: no es necesario cargar la fila completa
+        statement = select(
+            exists().where(
+                TrustedDevice.user_id == user_id,
+                TrustedDevice.device_id == device_id,
+                or_(
+                    TrustedDevice.expires_at.is_(None),
+                    TrustedDevice.expires_at > current_time
+                )
+            )
+        )
+        if not session.exec(statement).one():
             return False
         
-        # Verificar expiración si existe
-        if device.expires_at:
-            current_time = datetime.now(timezone.utc)
-            expires_at = device.expires_at.replace(tzinfo=timezone.utc) if device.expires_at.tzinfo is None else device.expires_at
-            
-            if current_time > expires_at:
-                # Eliminar dispositivo expirado
-                session.delete(device)
-                session.commit()
-                return False
-        
-        # Actualizar último uso
-        device.last_used_at = datetime.now(timezone.utc)
-        session.commit()
+        # Actualizar último uso como máximo una vez por hora por dispositivo
+        key = (user_id, device_id)
+        if key not in _recently_used_devices:
+            session.exec(
+                update(TrustedDevice)
+                .where(
+                    TrustedDevice.user_id == user_id,
+                    TrustedDevice.device_id == device_id
+                )
+                .values(last_used_at=current_time)
+            )
+            session.commit()
+            _recently_used_devices[key] = True
         
         return True
     
@@ -214,35 +232,33 @@ class OTPService:
         Returns:
             TrustedDevice creado o actualizado
         """
-        # Verificar si ya existe
-        statement = select(TrustedDevice).where(
-            TrustedDevice.user_id == user_id,
-            TrustedDevice.device_id == device_id
-        )
-        existing = session.exec(statement).first()
-        
-        if existing:
-            # Actualizar
-            existing.device_name = device_name or existing.device_name
-            existing.device_type = device_type or existing.device_type
-            existing.last_used_at = datetime.now(timezone.utc)
-            existing.expires_at = datetime.now(timezone.utc) + timedelta(days=OTPService.DEVICE_TRUST_DAYS)
-            session.commit()
-            session.refresh(existing)
-            return existing
+        current_time = datetime.now(timezone.utc)
+        expires_at = current_time + OTPService.DEVICE_TRUST_PERIOD
         
-        # Crear nuevo
-        device = TrustedDevice(
+        # Upsert en una sola sentencia (INSERT ... ON CONFLICT DO UPDATE)
+        statement = insert(TrustedDevice).values(
             user_id=user_id,
             device_id=device_id,
             device_name=device_name,
             device_type=device_type,
-            expires_at=datetime.now(timezone.utc) + timedelta(days=OTPService.DEVICE_TRUST_DAYS)
+            created_at=current_time,
+            last_used_at=current_time,
+            expires_at=expires_at
         )
-        
-        session.add(device)
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "device_id"],
+            set_={
+                "device_name": func.coalesce(statement.excluded.device_name, TrustedDevice.device_name),
+                "device_type": func.coalesce(statement.excluded.device_type, TrustedDevice.device_type),
+                "last_used_at": statement.excluded.last_used_at,
+                "expires_at": statement.excluded.expires_at
+            }
+        ).returning(TrustedDevice)
+        
+        device = session.exec(
+            statement.execution_options(populate_existing=True)
+        ).scalar_one()
         session.commit()
-        session.refresh(device)
         
         return device
     
@@ -286,10 +302,16 @@ class OTPService:
             user_id: ID del usuario
             
         Returns:
-            Lista de dispositivos de confianza
+            Lista de dispositivos de confianza (sin los expirados)
         """
+        current_time = datetime.now(timezone.utc)
+        
         statement = select(TrustedDevice).where(
-            TrustedDevice.user_id == user_id
+            TrustedDevice.user_id == user_id,
+            or_(
+                TrustedDevice.expires_at.is_(None),
+                TrustedDevice.expires_at > current_time
+            )
         ).order_by(TrustedDevice.last_used_at.desc())
         
         return list(session.exec(statement).all())
@@ -326,15 +348,9 @@ class OTPService:
             Número de OTPs eliminados
         """
         current_time = datetime.now(timezone.utc)
-        statement = select(OTPCode).where(
-            OTPCode.expires_at < current_time
-        )
-        expired = session.exec(statement).all()
-        
-        count = len(expired)
-        for otp in expired:
-            session.delete(otp)
+        statement = delete(OTPCode).where(OTPCode.expires_at < current_time)
+        result = session.exec(statement)
         
         session.commit()
         
-        return count
+        return result.rowcount
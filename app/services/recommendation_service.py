@@ -5,33 +5,73 @@ Genera recomendaciones personalizadas basadas en el historial del usuario
 
 from sqlmodel import Session, select
 from typing import List, Dict, Optional
+import re
 import json
+import hashlib
+import random
+import asyncio
+import logging
 import httpx
+from datetime import datetime
+from collections import Counter
+from threading import Lock
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
 from app.models.user import User
 from app.models.calification import CalificationGame
 from app.models.wishlist import WishList
 from app.models.game import Game
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Nombres de juegos de prueba que nunca deben recomendarse
+_TEST_RE = re.compile(r"test|teste|prueba|demo|local", re.IGNORECASE)
+
+# Cliente HTTP compartido (Groq y RAWG) para reutilizar conexiones TCP/TLS
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Obtiene el cliente HTTP compartido, creándolo la primera vez"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=30.0,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40)
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Cierra el cliente HTTP compartido (al apagar la app)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 class RecommendationService:
     """Servicio para generar recomendaciones de juegos usando IA (Groq)"""
     
+    # Recomendaciones recientes por usuario (el servicio se instancia por petición)
+    _rec_cache: TTLCache = TTLCache(maxsize=5000, ttl=600)
+    
     def __init__(self):
         """Inicializa el cliente de Groq API"""
         self.api_key = settings.GROQ_API_KEY
         self.api_url = "https://api.groq.com/openai/v1/chat/completions"
         self.model = "llama-3.3-70b-versatile"  # Modelo gratis y potente
-        
-        print(f"✅ Groq API inicializada con modelo: {self.model}")
     
     @staticmethod
     def get_user_history(session: Session, user_id: int) -> Dict:
         """Obtiene el historial completo del usuario"""
         
-        # Calificaciones altas (>= 7)
+        # Calificaciones altas (>= 7), solo las columnas necesarias
         high_rated_query = (
-            select(CalificationGame, Game)
+            select(Game.name, Game.genre, CalificationGame.score)
+            .select_from(CalificationGame)
             .join(Game, CalificationGame.game_id == Game.id)
             .where(CalificationGame.user_id == user_id)
             .where(CalificationGame.score >= 7)
@@ -40,64 +80,47 @@ class RecommendationService:
         
         # Wishlist
         wishlist_query = (
-            select(WishList, Game)
+            select(Game.name, Game.genre)
+            .select_from(WishList)
             .join(Game, WishList.game_id == Game.id)
             .where(WishList.user_id == user_id)
         )
         wishlist = session.exec(wishlist_query).all()
         
         # Extraer información relevante (filtrar juegos de prueba)
-        test_keywords = ['test', 'teste', 'prueba', 'demo', 'local']
-        
         liked_games = [
             {
-                "name": game.name,
-                "genre": game.genre,
-                "rating": cal.score
+                "name": name,
+                "genre": genre,
+                "rating": score
             }
-            for cal, game in high_rated
-            if not any(keyword in game.name.lower() for keyword in test_keywords)
+            for name, genre, score in high_rated
+            if not _TEST_RE.search(name)
         ]
         
         wishlist_games = [
             {
-                "name": game.name,
-                "genre": game.genre
+                "name": name,
+                "genre": genre
             }
-            for wl, game in wishlist
-            if not any(keyword in game.name.lower() for keyword in test_keywords)
+            for name, genre in wishlist
+            if not _TEST_RE.search(name)
         ]
         
         # Lista de juegos que YA tiene el usuario (para NO recomendarlos)
-        existing_games = set()
-        for cal, game in high_rated:
-            if not any(keyword in game.name.lower() for keyword in test_keywords):
-                existing_games.add(game.name)
-        for wl, game in wishlist:
-            if not any(keyword in game.name.lower() for keyword in test_keywords):
-                existing_games.add(game.name)
-        
-        # Extraer géneros favoritos
-        all_genres = []
-        for cal, game in high_rated:
-            if game.genre:
-                all_genres.extend([g.strip() for g in game.genre.split(',')])
-        
-        for wl, game in wishlist:
-            if game.genre:
-                all_genres.extend([g.strip() for g in game.genre.split(',')])
-        
-        # Contar frecuencia de géneros
-        genre_count = {}
-        for genre in all_genres:
-            genre_count[genre] = genre_count.get(genre, 0) + 1
+        # (reutiliza las listas ya filtradas en lugar de volver a filtrar)
+        existing_games = {game["name"] for game in liked_games}
+        existing_games.update(game["name"] for game in wishlist_games)
+        
+        # Contar frecuencia de géneros favoritos
+        genre_count = Counter()
+        for row in (*high_rated, *wishlist):
+            genre = row[1]
+            if genre:
+                genre_count.update(g.strip() for g in genre.split(','))
         
         # Top 5 géneros
-        favorite_genres = sorted(
-            genre_count.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:5]
+        favorite_genres = genre_count.most_common(5)
         
         return {
             "liked_games": liked_games,
@@ -106,7 +129,7 @@ class RecommendationService:
             "existing_games": list(existing_games)
         }
     
-    def generate_recommendations(
+    async def generate_recommendations(
         self, 
         session: Session, 
         user_id: int,
@@ -114,36 +137,41 @@ class RecommendationService:
     ) -> List[Dict]:
         """Genera recomendaciones usando Gemini AI"""
         
-        print(f"\n{'='*60}")
-        print(f"🎯 GENERANDO RECOMENDACIONES PARA USER_ID: {user_id}")
-        print(f"{'='*60}")
+        logger.debug("Generando recomendaciones para user_id=%s", user_id)
         
         # Obtener historial del usuario
         history = self.get_user_history(session, user_id)
         
-        print(f"\n📊 HISTORIAL DEL USUARIO:")
-        print(f"   💚 Juegos que le gustaron: {len(history['liked_games'])}")
-        for i, game in enumerate(history['liked_games'][:5], 1):
-            print(f"      {i}. {game['name']} ({game['rating']}/10)")
-        print(f"   ⭐ Wishlist: {len(history['wishlist_games'])}")
-        for i, game in enumerate(history['wishlist_games'][:5], 1):
-            print(f"      {i}. {game['name']}")
-        print(f"   🎮 Géneros favoritos: {', '.join(history['favorite_genres'])}")
-        print(f"   🚫 Juegos que YA tiene: {len(history['existing_games'])}")
+        logger.debug(
+            "Historial: %d juegos que le gustaron, %d en wishlist, %d que ya tiene, géneros favoritos: %s",
+            len(history["liked_games"]),
+            len(history["wishlist_games"]),
+            len(history["existing_games"]),
+            history["favorite_genres"]
+        )
         
         # Si no hay datos suficientes, recomendar populares
         if not history["liked_games"] and not history["wishlist_games"]:
-            print(f"\n⚠️ Sin datos suficientes, devolviendo juegos populares...")
+            logger.debug("Sin datos suficientes, devolviendo juegos populares")
             return self.get_popular_games(session, count)
         
+        # Reutilizar recomendaciones recientes si el historial no cambió
+        games_digest = hashlib.blake2b(
+            ",".join(sorted(history["existing_games"])).encode(),
+            digest_size=8
+        ).digest()
+        cache_key = (user_id, count, games_digest)
+        cached_recommendations = self._rec_cache.get(cache_key)
+        if cached_recommendations is not None:
+            logger.debug("Recomendaciones en caché para user_id=%s", user_id)
+            return cached_recommendations
+        
         # Construir prompt para Gemini
         prompt = self._build_prompt(history, count)
         
         try:
             # Llamar a Groq API para obtener NOMBRES de juegos
-            print(f"\n{'='*60}")
-            print(f"🤖 LLAMANDO A GROQ AI (Llama 3)...")
-            print(f"{'='*60}")
+            logger.debug("Llamando a Groq (%s)", self.model)
             
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -160,38 +188,36 @@ class RecommendationService:
                 ],
                 "temperature": 1.2,
                 "max_tokens": 2000,
-                "top_p": 0.95
+                "top_p": 0.95,
+                # Modo JSON: la respuesta es JSON válido, sin bloques markdown
+                "response_format": {"type": "json_object"}
             }
             
-            with httpx.Client(timeout=30.0) as client:
-                response = client.post(self.api_url, headers=headers, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
-                ai_response = data['choices'][0]['message']['content']
+            client = get_http_client()
+            response = await client.post(self.api_url, headers=headers, json=payload)
+            response.raise_for_status()
+            
+            data = response.json()
+            ai_response = data['choices'][0]['message']['content']
             
-            print(f"\n📝 RESPUESTA DE GROQ:")
-            print(ai_response)
-            print(f"{'='*60}\n")
+            logger.debug("Respuesta de Groq: %s", ai_response)
             
             # Parsear respuesta (solo nombres de juegos)
             recommended_names = self._parse_gemini_response(ai_response)
             
-            print(f"✅ Juegos parseados de Groq: {len(recommended_names)}")
-            for i, game in enumerate(recommended_names, 1):
-                print(f"  {i}. {game.get('name')} - {game.get('genre')}")
+            logger.debug("Juegos parseados de Groq: %d", len(recommended_names))
             
             # Buscar cada juego en RAWG API
             recommendations = []
-            print(f"\n🔍 BUSCANDO EN RAWG API...")
-            print(f"{'='*60}")
             
-            for game_rec in recommended_names[:count]:
-                print(f"\n🎮 Buscando: '{game_rec['name']}'...")
-                rawg_data = self._search_game_in_rawg(game_rec["name"])
-                
+            # Las búsquedas son independientes: se lanzan en paralelo
+            candidates = recommended_names[:count]
+            rawg_results = await asyncio.gather(
+                *(self._search_game_in_rawg(game_rec["name"]) for game_rec in candidates)
+            )
+            
+            for game_rec, rawg_data in zip(candidates, rawg_results):
                 if rawg_data:
-                    print(f"   ✅ Encontrado: {rawg_data.get('name')}")
                     recommendations.append({
                         "name": rawg_data.get("name", game_rec["name"]),
                         "genre": ", ".join([g["name"] for g in rawg_data.get("genres", [])]) or game_rec.get("genre", "Varios"),
@@ -203,20 +229,21 @@ class RecommendationService:
                         "released": rawg_data.get("released"),
                     })
                 else:
-                    print(f"   ❌ NO encontrado en RAWG")
+                    logger.debug("'%s' no encontrado en RAWG", game_rec["name"])
                     # Si no se encuentra en RAWG, usar datos de Gemini
                     recommendations.append(game_rec)
             
-            print(f"\n{'='*60}")
-            print(f"✨ TOTAL RECOMENDACIONES: {len(recommendations)}")
-            print(f"{'='*60}\n")
+            logger.debug("Total de recomendaciones: %d", len(recommendations))
+            
+            recommendations = recommendations[:count]
+            # Una respuesta vacía (JSON inválido o sin "recommendations") no se cachea
+            if recommendations:
+                self._rec_cache[cache_key] = recommendations
             
-            return recommendations[:count]
+            return recommendations
             
         except Exception as e:
-            print(f"❌ Error con Groq API: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error con Groq API: %s", e)
             # Fallback a recomendaciones por géneros
             return self.get_recommendations_by_genre(
                 session, 
@@ -226,48 +253,40 @@ class RecommendationService:
             )
     
     def _build_prompt(self, history: Dict, count: int) -> str:
-        """Construye el prompt para Groq"""
-        
-        import random
-        from datetime import datetime
+        """Construye el prompt para Groq (por partes, unidas al final)"""
         
         # Agregar variabilidad temporal
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         random_seed = random.randint(1, 10000)
         
-        print(f"\n📝 CONSTRUYENDO PROMPT...")
-        print(f"   🎲 Random Seed: {random_seed}")
-        print(f"   ⏰ Timestamp: {timestamp}")
-        print(f"   🎮 Juegos que ya tiene: {len(history.get('existing_games', []))}")
-        if history.get('existing_games'):
-            print(f"   📋 Primeros 5: {history['existing_games'][:5]}")
+        logger.debug("Construyendo prompt (seed=%s, timestamp=%s)", random_seed, timestamp)
         
-        prompt = f"""Eres un experto en videojuegos. Basándote en el historial del usuario, recomienda {count} juegos DIFERENTES.
+        parts = [f"""Eres un experto en videojuegos. Basándote en el historial del usuario, recomienda {count} juegos DIFERENTES.
 
 IMPORTANTE: Esta es la solicitud #{random_seed} del {timestamp}. Debes dar recomendaciones VARIADAS y DIFERENTES a solicitudes anteriores.
 
 HISTORIAL DEL USUARIO:
 
 Juegos que le gustaron (calificación alta):
-"""
+"""]
         
         for game in history["liked_games"][:10]:
-            prompt += f"- {game['name']} ({game['genre']}) - Rating: {game['rating']}/10\n"
+            parts.append(f"- {game['name']} ({game['genre']}) - Rating: {game['rating']}/10\n")
         
         if history["wishlist_games"]:
-            prompt += "\nJuegos en su wishlist:\n"
+            parts.append("\nJuegos en su wishlist:\n")
             for game in history["wishlist_games"][:10]:
-                prompt += f"- {game['name']} ({game['genre']})\n"
+                parts.append(f"- {game['name']} ({game['genre']})\n")
         
-        prompt += f"\nGéneros favoritos: {', '.join(history['favorite_genres'])}\n"
+        parts.append(f"\nGéneros favoritos: {', '.join(history['favorite_genres'])}\n")
         
         # Lista de juegos que NO debe recomendar
         if history.get("existing_games"):
-            prompt += "\n⚠️ JUEGOS QUE EL USUARIO YA TIENE (NO RECOMENDARLOS):\n"
+            parts.append("\n⚠️ JUEGOS QUE EL USUARIO YA TIENE (NO RECOMENDARLOS):\n")
             for game_name in history["existing_games"][:15]:  # Limitar a 15 para no saturar el prompt
-                prompt += f"- {game_name}\n"
+                parts.append(f"- {game_name}\n")
         
-        prompt += f"""
+        parts.append(f"""
 
 INSTRUCCIONES CRÍTICAS:
 1. Recomienda {count} juegos REALES de la industria (AAA, indies populares, etc.)
@@ -295,37 +314,24 @@ FORMATO DE RESPUESTA (JSON estricto):
   ]
 }}
 
-Responde SOLO con el JSON, sin texto adicional."""
+Responde SOLO con el JSON, sin texto adicional.""")
         
-        return prompt
+        return "".join(parts)
     
     def _parse_gemini_response(self, response_text: str) -> List[Dict]:
-        """Parsea la respuesta de Gemini"""
+        """Parsea la respuesta de Gemini (JSON puro gracias a response_format)"""
         try:
-            # Limpiar la respuesta (remover markdown si existe)
-            clean_text = response_text.strip()
-            if clean_text.startswith("```json"):
-                clean_text = clean_text[7:]
-            if clean_text.startswith("```"):
-                clean_text = clean_text[3:]
-            if clean_text.endswith("```"):
-                clean_text = clean_text[:-3]
-            
-            clean_text = clean_text.strip()
-            
-            # Parsear JSON
-            data = json.loads(clean_text)
-            return data.get("recommendations", [])
+            return json.loads(response_text).get("recommendations", [])
             
         except json.JSONDecodeError as e:
-            print(f"Error parseando respuesta de Gemini: {e}")
-            print(f"Respuesta recibida: {response_text}")
+            logger.warning("Error parseando respuesta de Gemini: %s", e)
+            logger.debug("Respuesta recibida: %s", response_text)
             return []
     
-    def _search_game_in_rawg(self, game_name: str) -> Optional[Dict]:
+    async def _search_game_in_rawg(self, game_name: str) -> Optional[Dict]:
         """Busca un juego en RAWG API por nombre"""
         if not settings.RAWG_API_KEY:
-            print("⚠️ RAWG_API_KEY no configurada")
+            logger.warning("RAWG_API_KEY no configurada")
             return None
         
         try:
@@ -337,41 +343,41 @@ Responde SOLO con el JSON, sin texto adicional."""
                 "search_precise": True
             }
             
-            print(f"      🌐 URL: {url}")
-            print(f"      🔑 API Key: {settings.RAWG_API_KEY[:20]}...")
-            print(f"      🔎 Buscando: '{game_name}'")
+            logger.debug("Buscando en RAWG: '%s'", game_name)
             
-            with httpx.Client(timeout=10.0) as client:
-                response = client.get(url, params=params)
-                
-                print(f"      📡 Status Code: {response.status_code}")
+            client = get_http_client()
+            response = await client.get(url, params=params, timeout=10.0)
+            
+            if response.status_code == 200:
+                data = response.json()
+                results = data.get("results", [])
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    results = data.get("results", [])
-                    print(f"      📊 Resultados: {len(results)}")
-                    
-                    if results:
-                        game = results[0]
-                        print(f"      ✅ Encontrado: '{game.get('name')}' (ID: {game.get('id')})")
-                        print(f"         Imagen: {game.get('background_image', 'N/A')[:50]}...")
-                        return game
-                    else:
-                        print(f"      ⚠️ Sin resultados para '{game_name}'")
+                if results:
+                    game = results[0]
+                    logger.debug("Encontrado en RAWG: '%s' (ID: %s)", game.get("name"), game.get("id"))
+                    return game
                 else:
-                    print(f"      ❌ Error HTTP: {response.status_code}")
-                    print(f"      Response: {response.text[:200]}")
-                    
+                    logger.debug("Sin resultados en RAWG para '%s'", game_name)
+            else:
+                logger.warning("Error HTTP de RAWG: %s", response.status_code)
+                
         except Exception as e:
-            print(f"      🚨 Error buscando en RAWG: {e}")
+            logger.warning("Error buscando en RAWG: %s", e)
         
         return None
     
     @staticmethod
+    @cached(
+        cache=TTLCache(maxsize=8, ttl=300),
+        key=lambda session, count=5: hashkey(count),
+        lock=Lock()
+    )
     def get_popular_games(session: Session, count: int = 5) -> List[Dict]:
-        """Fallback: devuelve juegos populares si no hay historial"""
+        """
+        Fallback: devuelve juegos populares si no hay historial
         
-        test_keywords = ['test', 'teste', 'prueba', 'demo', 'local']
+        El ranking cambia poco, así que se cachea 5 minutos por `count`.
+        """
         
         query = (
             select(Game)
@@ -385,7 +391,7 @@ Responde SOLO con el JSON, sin texto adicional."""
         # Filtrar juegos de prueba
         filtered_games = [
             game for game in games
-            if not any(keyword in game.name.lower() for keyword in test_keywords)
+            if not _TEST_RE.search(game.name)
         ]
         
         return [
@@ -415,7 +421,6 @@ Responde SOLO con el JSON, sin texto adicional."""
         
         # Buscar juegos de géneros favoritos
         recommendations = []
-        test_keywords = ['test', 'teste', 'prueba', 'demo', 'local']
         
         for genre in favorite_genres:
             query = (
@@ -432,7 +437,7 @@ Responde SOLO con el JSON, sin texto adicional."""
                     break
                 
                 # Saltar si es juego de prueba
-                if any(keyword in game.name.lower() for keyword in test_keywords):
+                if _TEST_RE.search(game.name):
                     continue
                 
                 # Saltar si el usuario ya lo tiene
@@ -1,36 +1,137 @@
-from sqlmodel import Session, select
-from typing import Optional, List
-from datetime import datetime, timedelta
+import re
+from sqlmodel import Session, select, update, or_, func
+from sqlalchemy.exc import IntegrityError
+from typing import Optional, List, Dict, Iterator, Tuple
+from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, status
 from app.models import (
     User, UserCreate, UserCreateGoogle, UserUpdate, 
     UserUpdatePassword, AuthProvider
 )
 from app.core import (
-    hash_password, verify_password, validate_password_strength,
-    generate_verification_token, generate_reset_password_token
+    hash_password_async, verify_password_async, validate_password_strength,
+    generate_verification_token, generate_reset_password_token, hash_token
 )
 
 
 class UserService:
     """Servicio para operaciones CRUD de usuarios"""
     
+    # Tope de get_all: para recorrer todos los usuarios está iter_users
+    MAX_PAGE_SIZE = 1000
+    
+    @staticmethod
+    def _user_cache(session: Session) -> Dict[Tuple[str, object], User]:
+        """
+        Caché de usuarios ligada a la sesión (vive lo que dura la petición).
+        Claves: ("id", id), ("email", email) y ("username", username) en minúsculas.
+        """
+        return session.info.setdefault("user_cache", {})
+    
+    @staticmethod
+    def _cache_put(session: Session, user: User) -> None:
+        """Guardar un usuario en la caché bajo sus tres claves"""
+        cache = UserService._user_cache(session)
+        cache[("id", user.id)] = user
+        cache[("email", user.email.lower())] = user
+        cache[("username", user.username.lower())] = user
+    
+    @staticmethod
+    def _invalidate_cached_user(session: Session, user_id: int) -> None:
+        """
+        Quitar un usuario de la caché de la sesión (todas sus claves).
+        Llamar antes de cambiar su email o username.
+        """
+        cache = UserService._user_cache(session)
+        user = cache.pop(("id", user_id), None)
+        if user is not None:
+            for key in [key for key, cached in cache.items() if cached is user]:
+                del cache[key]
+    
+    @staticmethod
+    def _release_connection(session: Session) -> None:
+        """
+        Cerrar la transacción de lectura para devolver la conexión al pool
+        (antes de bcrypt). Con expire_on_commit=False los objetos cargados siguen válidos.
+        """
+        session.commit()
+    
+    @staticmethod
+    def _update_returning(session: Session, *conditions, **values) -> Optional[User]:
+        """
+        UPDATE ... RETURNING en un solo viaje a la BD.
+        Retorna el usuario actualizado o None si ninguna fila cumple las condiciones.
+        """
+        statement = (
+            update(User)
+            .where(*conditions)
+            .values(**values)
+            .returning(User)
+            .execution_options(populate_existing=True)
+        )
+        return session.exec(statement).scalar_one_or_none()
+    
     @staticmethod
     def get_by_id(session: Session, user_id: int) -> Optional[User]:
-        """Obtener usuario por ID"""
-        return session.get(User, user_id)
+        """Obtener usuario por ID (reutiliza la caché de la petición)"""
+        cached = UserService._user_cache(session).get(("id", user_id))
+        if cached is not None:
+            return cached
+        
+        user = session.get(User, user_id)
+        if user is not None:
+            UserService._cache_put(session, user)
+        return user
+    
+    @staticmethod
+    def list_by_ids(session: Session, user_ids: List[int]) -> List[Optional[User]]:
+        """
+        Obtener varios usuarios por ID en una sola consulta.
+        Respeta el orden de user_ids (None si el usuario no existe).
+        """
+        cache = UserService._user_cache(session)
+        missing = {user_id for user_id in user_ids if ("id", user_id) not in cache}
+        
+        if missing:
+            statement = select(User).where(User.id.in_(missing))
+            for user in session.exec(statement).all():
+                UserService._cache_put(session, user)
+        
+        return [cache.get(("id", user_id)) for user_id in user_ids]
     
     @staticmethod
     def get_by_email(session: Session, email: str) -> Optional[User]:
-        """Obtener usuario por email"""
-        statement = select(User).where(User.email == email)
-        return session.exec(statement).first()
+        """Obtener usuario por email (sin distinguir mayúsculas, reutiliza la caché)"""
+        cached = UserService._user_cache(session).get(("email", email.lower()))
+        if cached is not None:
+            return cached
+        
+        statement = select(User).where(func.lower(User.email) == email.lower())
+        user = session.exec(statement).first()
+        if user is not None:
+            UserService._cache_put(session, user)
+        return user
+    
+    @staticmethod
+    def _exists_by_email(session: Session, email: str, exclude_user_id: Optional[int] = None) -> bool:
+        """Comprobar si el email está en uso (solo lee el id, no la fila completa)"""
+        statement = select(User.id).where(func.lower(User.email) == email.lower())
+        if exclude_user_id is not None:
+            statement = statement.where(User.id != exclude_user_id)
+        return session.exec(statement.limit(1)).first() is not None
     
     @staticmethod
     def get_by_username(session: Session, username: str) -> Optional[User]:
-        """Obtener usuario por username"""
-        statement = select(User).where(User.username == username)
-        return session.exec(statement).first()
+        """Obtener usuario por username (sin distinguir mayúsculas, reutiliza la caché)"""
+        cached = UserService._user_cache(session).get(("username", username.lower()))
+        if cached is not None:
+            return cached
+        
+        statement = select(User).where(func.lower(User.username) == username.lower())
+        user = session.exec(statement).first()
+        if user is not None:
+            UserService._cache_put(session, user)
+        return user
     
     @staticmethod
     def get_by_google_id(session: Session, google_id: str) -> Optional[User]:
@@ -45,8 +146,8 @@ class UserService:
         limit: int = 100,
         is_active: Optional[bool] = None
     ) -> List[User]:
-        """Obtener lista de usuarios con paginación"""
-        statement = select(User).offset(skip).limit(limit)
+        """Obtener lista de usuarios con paginación (como máximo MAX_PAGE_SIZE por página)"""
+        statement = select(User).offset(skip).limit(min(limit, UserService.MAX_PAGE_SIZE))
         
         if is_active is not None:
             statement = statement.where(User.is_active == is_active)
@@ -54,23 +155,50 @@ class UserService:
         return list(session.exec(statement).all())
     
     @staticmethod
-    def create_user(session: Session, user_data: UserCreate) -> User:
-        """Crear nuevo usuario con validaciones"""
-        # Validar que el email no exista
-        if UserService.get_by_email(session, user_data.email):
+    def iter_users(
+        session: Session,
+        *,
+        is_active: Optional[bool] = None,
+        chunk: int = 500
+    ) -> Iterator[User]:
+        """
+        Recorrer todos los usuarios en bloques de `chunk` filas.
+        Memoria constante: pensado para exportaciones, no para respuestas paginadas.
+        """
+        statement = select(User).order_by(User.id).execution_options(yield_per=chunk)
+        
+        if is_active is not None:
+            statement = statement.where(User.is_active == is_active)
+        
+        yield from session.exec(statement)
+    
+    @staticmethod
+    def _ensure_signup_available(session: Session, email: str, username: str) -> None:
+        """Lanzar 400 si el email (ya en minúsculas) o el username están en uso"""
+        statement = select(func.lower(User.email).label("email"), User.username).where(
+            or_(
+                func.lower(User.email) == email,
+                func.lower(User.username) == username.lower()
+            )
+        ).limit(2)
+        existing = session.exec(statement).all()
+        
+        if any(row.email == email for row in existing):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
         
-        # Validar que el username no exista
-        if UserService.get_by_username(session, user_data.username):
+        if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already taken"
             )
-        
-        # Validar fortaleza de contraseña
+    
+    @staticmethod
+    async def create_user(session: Session, user_data: UserCreate) -> User:
+        """Crear nuevo usuario con validaciones"""
+        # Validar fortaleza de contraseña antes de tocar la BD
         is_valid, error_msg = validate_password_strength(user_data.password)
         if not is_valid:
             raise HTTPException(
@@ -78,21 +206,38 @@ class UserService:
                 detail=error_msg
             )
         
-        # Crear usuario
+        # El email se guarda siempre en minúsculas
+        email = user_data.email.lower()
+        
+        # Validar email y username únicos en una sola consulta
+        UserService._ensure_signup_available(session, email, user_data.username)
+        
+        UserService._release_connection(session)
+        
+        # Crear usuario (en BD solo se guarda el hash del token)
+        activation_token = generate_verification_token()
         user = User(
             username=user_data.username,
-            email=user_data.email,
+            email=email,
             age=user_data.age,
             gender=user_data.gender,
-            hashed_password=hash_password(user_data.password),
+            hashed_password=await hash_password_async(user_data.password),
             auth_provider=AuthProvider.LOCAL,
-            verification_token=generate_verification_token(),
+            verification_token=hash_token(activation_token),
             is_verified=False
         )
         
         session.add(user)
-        session.commit()
-        session.refresh(user)
+        try:
+            session.commit()
+        except IntegrityError:
+            # Otro registro con el mismo email/username entró mientras corría bcrypt
+            session.rollback()
+            UserService._ensure_signup_available(session, email, user_data.username)
+            raise
+        
+        # Token en claro para el email de activación
+        user._activation_token = activation_token
         
         return user
     
@@ -112,21 +257,25 @@ class UserService:
             existing_user.profile_picture = user_data.profile_picture
             session.add(existing_user)
             session.commit()
-            session.refresh(existing_user)
             return existing_user
         
-        # Verificar username único
+        # Verificar username único: una consulta trae solo base y base + dígitos
         base_username = user_data.username
+        statement = select(func.lower(User.username)).where(
+            func.lower(User.username).regexp_match(f"^{re.escape(base_username.lower())}[0-9]*$")
+        )
+        taken_usernames = set(session.exec(statement).all())
+        
         username = base_username
         counter = 1
-        while UserService.get_by_username(session, username):
+        while username.lower() in taken_usernames:
             username = f"{base_username}{counter}"
             counter += 1
         
         # Crear nuevo usuario
         user = User(
             username=username,
-            email=user_data.email,
+            email=user_data.email.lower(),
             google_id=user_data.google_id,
             profile_picture=user_data.profile_picture,
             auth_provider=AuthProvider.GOOGLE,
@@ -136,7 +285,6 @@ class UserService:
         
         session.add(user)
         session.commit()
-        session.refresh(user)
         
         return user
     
@@ -154,44 +302,64 @@ class UserService:
                 detail="User not found"
             )
         
-        # Validar email único si se está cambiando
-        if user_data.email and user_data.email != user.email:
-            if UserService.get_by_email(session, user_data.email):
+        # El email se normaliza una sola vez, al escribir
+        new_email = user_data.email.lower() if user_data.email else None
+        email_changed = bool(new_email) and new_email != user.email
+        username_changed = bool(user_data.username) and user_data.username != user.username
+        
+        # Validar email y username únicos en una sola consulta
+        conditions = []
+        if email_changed:
+            conditions.append(func.lower(User.email) == new_email)
+        if username_changed:
+            conditions.append(func.lower(User.username) == user_data.username.lower())
+        
+        if conditions:
+            statement = select(func.lower(User.email).label("email"), User.username).where(
+                User.id != user_id, or_(*conditions)
+            ).limit(2)
+            existing = session.exec(statement).all()
+            
+            if email_changed and any(row.email == new_email for row in existing):
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Email already in use"
                 )
-            user.email = user_data.email
-            user.is_verified = False  # Requerir nueva verificación
-            user.verification_token = generate_verification_token()
-        
-        # Validar username único si se está cambiando
-        if user_data.username and user_data.username != user.username:
-            if UserService.get_by_username(session, user_data.username):
+            
+            if existing:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Username already taken"
                 )
-            user.username = user_data.username
+        
+        changes = {}
+        
+        if email_changed:
+            changes["email"] = new_email
+            changes["is_verified"] = False  # Requerir nueva verificación
+            changes["verification_token"] = hash_token(generate_verification_token())
+        
+        if username_changed:
+            changes["username"] = user_data.username
         
         # Actualizar otros campos
         if user_data.age is not None:
-            user.age = user_data.age
+            changes["age"] = user_data.age
         if user_data.gender is not None:
-            user.gender = user_data.gender
+            changes["gender"] = user_data.gender
         if user_data.profile_picture is not None:
-            user.profile_picture = user_data.profile_picture
-        
-        user.updated_at = datetime.utcnow()
+            changes["profile_picture"] = user_data.profile_picture
+        changes["updated_at"] = datetime.now(timezone.utc)
         
-        session.add(user)
+        # Invalidar antes del UPDATE: las claves de email/username antiguas salen de la caché
+        UserService._invalidate_cached_user(session, user_id)
+        user = UserService._update_returning(session, User.id == user_id, **changes)
         session.commit()
-        session.refresh(user)
         
         return user
     
     @staticmethod
-    def update_password(
+    async def update_password(
         session: Session,
         user_id: int,
         password_data: UserUpdatePassword
@@ -211,26 +379,29 @@ class UserService:
                 detail="Cannot change password for Google accounts"
             )
         
-        # Verificar contraseña actual
-        if not verify_password(password_data.current_password, user.hashed_password):
+        # Validar nueva contraseña antes de gastar un bcrypt en la actual
+        is_valid, error_msg = validate_password_strength(password_data.new_password)
+        if not is_valid:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Incorrect current password"
+                detail=error_msg
             )
         
-        # Validar nueva contraseña
-        is_valid, error_msg = validate_password_strength(password_data.new_password)
-        if not is_valid:
+        UserService._release_connection(session)
+        
+        # Verificar contraseña actual
+        if not await verify_password_async(password_data.current_password, user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=error_msg
+                detail="Incorrect current password"
             )
         
         # Actualizar contraseña
-        user.hashed_password = hash_password(password_data.new_password)
-        user.updated_at = datetime.utcnow()
+        user.hashed_password = await hash_password_async(password_data.new_password)
+        user.updated_at = datetime.now(timezone.utc)
         
         session.add(user)
+        UserService._invalidate_cached_user(session, user.id)
         session.commit()
         
         return True
@@ -243,8 +414,15 @@ class UserService:
     @staticmethod
     def activate_account(session: Session, token: str) -> User:
         """Activar cuenta con token de email"""
-        statement = select(User).where(User.verification_token == token)
-        user = session.exec(statement).first()
+        user = UserService._update_returning(
+            session,
+            User.verification_token == hash_token(token),
+            User.is_email_activated == False,
+            is_verified=True,
+            is_email_activated=True,
+            verification_token=None,
+            updated_at=datetime.now(timezone.utc)
+        )
         
         if not user:
             raise HTTPException(
@@ -252,104 +430,116 @@ class UserService:
                 detail="Invalid activation token"
             )
         
-        if user.is_email_activated:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Account is already activated"
-            )
-        
-        user.is_verified = True
-        user.is_email_activated = True
-        user.verification_token = None
-        user.updated_at = datetime.utcnow()
-        
-        session.add(user)
+        UserService._invalidate_cached_user(session, user.id)
         session.commit()
-        session.refresh(user)
         
         return user
     
     @staticmethod
     def regenerate_activation_token(session: Session, user_id: int) -> User:
         """Regenerar token de activación"""
-        user = UserService.get_by_id(session, user_id)
+        activation_token = generate_verification_token()
+        user = UserService._update_returning(
+            session,
+            User.id == user_id,
+            User.is_email_activated == False,
+            verification_token=hash_token(activation_token),
+            updated_at=datetime.now(timezone.utc)
+        )
         
         if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
-        
-        if user.is_email_activated:
+            # Solo en el caso de error se consulta el motivo
+            if not UserService.get_by_id(session, user_id):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="User not found"
+                )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Account is already activated"
             )
         
-        user.verification_token = generate_verification_token()
-        user.updated_at = datetime.utcnow()
-        
-        session.add(user)
+        UserService._invalidate_cached_user(session, user_id)
         session.commit()
-        session.refresh(user)
+        
+        user._activation_token = activation_token
         
         return user
     
     @staticmethod
-    def request_password_reset(session: Session, email: str) -> User:
-        """Solicitar reset de contraseña"""
-        user = UserService.get_by_email(session, email)
+    def request_password_reset(session: Session, email: str) -> Optional[User]:
+        """
+        Solicitar reset de contraseña.
+        Retorna None si el email no existe. Ambos casos hacen el mismo trabajo
+        (token, hash, UPDATE y commit) para no revelar por tiempo si el email existe.
+        """
+        reset_token = generate_reset_password_token()
+        user = UserService._update_returning(
+            session,
+            func.lower(User.email) == email.lower(),
+            reset_password_token=hash_token(reset_token),
+            reset_password_expires=datetime.now(timezone.utc) + timedelta(hours=1)
+        )
+        session.commit()
+        
         if not user:
-            # Por seguridad, no revelar si el email existe
-            raise HTTPException(
-                status_code=status.HTTP_200_OK,
-                detail="If the email exists, a reset link will be sent"
-            )
+            return None
         
-        # Generar token de reset
-        user.reset_password_token = generate_reset_password_token()
-        user.reset_password_expires = datetime.utcnow() + timedelta(hours=1)
+        UserService._invalidate_cached_user(session, user.id)
         
-        session.add(user)
-        session.commit()
-        session.refresh(user)
+        # Token en claro para el email de reset
+        user._reset_token = reset_token
         
         return user
     
     @staticmethod
-    def reset_password(session: Session, token: str, new_password: str) -> bool:
+    async def reset_password(session: Session, token: str, new_password: str) -> bool:
         """Resetear contraseña con token"""
-        statement = select(User).where(User.reset_password_token == token)
-        user = session.exec(statement).first()
-        
-        if not user:
+        # Validar nueva contraseña
+        is_valid, error_msg = validate_password_strength(new_password)
+        if not is_valid:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid or expired reset token"
+                detail=error_msg
             )
         
-        # Verificar que no haya expirado
-        if user.reset_password_expires < datetime.utcnow():
+        # Comprobar el token antes de bcrypt: un token inventado no debe costar un hash
+        token_hash = hash_token(token)
+        user_id = session.exec(
+            select(User.id).where(
+                User.reset_password_token == token_hash,
+                User.reset_password_expires > datetime.now(timezone.utc)
+            )
+        ).first()
+        
+        if user_id is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Reset token has expired"
+                detail="Invalid or expired reset token"
             )
         
-        # Validar nueva contraseña
-        is_valid, error_msg = validate_password_strength(new_password)
-        if not is_valid:
+        UserService._release_connection(session)
+        hashed_password = await hash_password_async(new_password)
+        
+        # El UPDATE repite las condiciones: si el token se usó mientras tanto, no aplica
+        user = UserService._update_returning(
+            session,
+            User.id == user_id,
+            User.reset_password_token == token_hash,
+            User.reset_password_expires > datetime.now(timezone.utc),
+            hashed_password=hashed_password,
+            reset_password_token=None,
+            reset_password_expires=None,
+            updated_at=datetime.now(timezone.utc)
+        )
+        
+        if not user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=error_msg
+                detail="Invalid or expired reset token"
             )
         
-        # Actualizar contraseña
-        user.hashed_password = hash_password(new_password)
-        user.reset_password_token = None
-        user.reset_password_expires = None
-        user.updated_at = datetime.utcnow()
-        
-        session.add(user)
+        UserService._invalidate_cached_user(session, user.id)
         session.commit()
         
         return True
@@ -357,29 +547,35 @@ class UserService:
     @staticmethod
     def delete_user(session: Session, user_id: int) -> bool:
         """Eliminar usuario (soft delete)"""
-        user = UserService.get_by_id(session, user_id)
-        if not user:
+        statement = (
+            update(User)
+            .where(User.id == user_id)
+            .values(is_active=False, updated_at=datetime.now(timezone.utc))
+        )
+        result = session.exec(statement)
+        if result.rowcount == 0:
+            session.rollback()
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
-        user.is_active = False
-        user.updated_at = datetime.utcnow()
-        
-        session.add(user)
+        UserService._invalidate_cached_user(session, user_id)
         session.commit()
         
         return True
     
     @staticmethod
     def update_last_login(session: Session, user_id: int) -> None:
-        """Actualizar fecha de último login"""
-        user = UserService.get_by_id(session, user_id)
-        if user:
-            user.last_login = datetime.utcnow()
-            session.add(user)
-            session.commit()
+        """Actualizar fecha de último login (un solo UPDATE, sin cargar el usuario)"""
+        statement = (
+            update(User)
+            .where(User.id == user_id)
+            .values(last_login=datetime.now(timezone.utc))
+        )
+        session.exec(statement)
+        UserService._invalidate_cached_user(session, user_id)
+        session.commit()
     
     @staticmethod
     def request_email_change(session: Session, user_id: int, new_email: str) -> User:
@@ -394,16 +590,18 @@ class UserService:
                 detail="User not found"
             )
         
+        # Los emails se guardan en minúsculas: basta normalizar el nuevo
+        new_email = new_email.lower()
+        
         # Validar que el nuevo email sea diferente al actual
-        if new_email.lower() == user.email.lower():
+        if new_email == user.email:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="New email must be different from current email"
             )
         
         # Validar que el nuevo email no esté en uso
-        existing_user = UserService.get_by_email(session, new_email)
-        if existing_user and existing_user.id != user_id:
+        if UserService._exists_by_email(session, new_email, exclude_user_id=user_id):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already in use by another account"
@@ -413,12 +611,11 @@ class UserService:
         user.is_active = False
         user.pending_email = new_email
         user.email_change_token = generate_verification_token()
-        user.email_change_expires = datetime.utcnow() + timedelta(hours=24)
-        user.updated_at = datetime.utcnow()
+        user.email_change_expires = datetime.now(timezone.utc) + timedelta(hours=24)
+        user.updated_at = datetime.now(timezone.utc)
         
         session.add(user)
         session.commit()
-        session.refresh(user)
         
         return user
     
@@ -428,33 +625,37 @@ class UserService:
         Confirmar cambio de email con token.
         Actualiza el email y reactiva la cuenta.
         """
-        from sqlmodel import select
-        
-        statement = select(User).where(User.email_change_token == token)
+        # Expiración y email pendiente se filtran en la consulta
+        statement = select(User).where(
+            User.email_change_token == token,
+            User.email_change_expires > datetime.now(timezone.utc),
+            User.pending_email.is_not(None)
+        )
         user = session.exec(statement).first()
         
         if not user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid or expired verification token"
-            )
-        
-        # Verificar que no haya expirado
-        if user.email_change_expires and user.email_change_expires < datetime.utcnow():
+            # Solo en el caso de error se consulta el motivo
+            stale = session.exec(
+                select(User.id, User.pending_email).where(User.email_change_token == token)
+            ).first()
+            if stale is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid or expired verification token"
+                )
+            if stale.pending_email is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="No email change request found"
+                )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Verification token has expired"
             )
         
-        # Verificar que haya un email pendiente
-        if not user.pending_email:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No email change request found"
-            )
-        
         # Guardar el email anterior para notificación
         old_email = user.email
+        UserService._invalidate_cached_user(session, user.id)
         
         # Actualizar email
         user.email = user.pending_email
@@ -463,11 +664,10 @@ class UserService:
         user.email_change_expires = None
         user.is_active = True  # Reactivar cuenta
         user.is_verified = True  # Mantener verificado
-        user.updated_at = datetime.utcnow()
+        user.updated_at = datetime.now(timezone.utc)
         
         session.add(user)
         session.commit()
-        session.refresh(user)
         
         # Guardar el email anterior para enviar notificación después
         user._old_email = old_email
@@ -479,29 +679,32 @@ class UserService:
         """
         Cancelar cambio de email pendiente y reactivar cuenta.
         """
-        user = UserService.get_by_id(session, user_id)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
+        # Cancelar cambio y reactivar en un solo UPDATE (solo si hay un cambio pendiente)
+        user = UserService._update_returning(
+            session,
+            User.id == user_id,
+            User.pending_email.is_not(None),
+            pending_email=None,
+            email_change_token=None,
+            email_change_expires=None,
+            is_active=True,
+            updated_at=datetime.now(timezone.utc)
+        )
         
-        if not user.pending_email:
+        if not user:
+            # Solo en el caso de error se consulta el motivo
+            if not UserService.get_by_id(session, user_id):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="User not found"
+                )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="No email change request found"
             )
         
-        # Cancelar cambio y reactivar
-        user.pending_email = None
-        user.email_change_token = None
-        user.email_change_expires = None
-        user.is_active = True
-        user.updated_at = datetime.utcnow()
-        
-        session.add(user)
+        UserService._invalidate_cached_user(session, user_id)
         session.commit()
-        session.refresh(user)
         
         return user
     
@@ -515,41 +718,39 @@ class UserService:
         from app.models import WishList, Friend, CalificationGame, CommentUser
         from app.models.device import TrustedDevice, OTPCode
         
-        user = UserService.get_by_id(session, user_id)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
+        # Borrados masivos sin sincronizar la sesión: no se cargan ni recorren filas en memoria
+        bulk = {"synchronize_session": False}
         
         try:
             # 1. Eliminar wishlist items
-            session.exec(delete(WishList).where(WishList.user_id == user_id))
+            session.exec(delete(WishList).where(WishList.user_id == user_id), execution_options=bulk)
             
             # 2. Eliminar solicitudes de amistad (enviadas y recibidas)
             session.exec(delete(Friend).where(
                 (Friend.requester_id == user_id) | (Friend.receiver_id == user_id)
-            ))
+            ), execution_options=bulk)
             
             # 3. Eliminar calificaciones
-            session.exec(delete(CalificationGame).where(CalificationGame.user_id == user_id))
+            session.exec(delete(CalificationGame).where(CalificationGame.user_id == user_id), execution_options=bulk)
             
             # 4. Eliminar comentarios
-            session.exec(delete(CommentUser).where(CommentUser.user_id == user_id))
+            session.exec(delete(CommentUser).where(CommentUser.user_id == user_id), execution_options=bulk)
             
             # 5. Eliminar dispositivos de confianza
-            session.exec(delete(TrustedDevice).where(TrustedDevice.user_id == user_id))
+            session.exec(delete(TrustedDevice).where(TrustedDevice.user_id == user_id), execution_options=bulk)
             
             # 6. Eliminar códigos OTP
-            session.exec(delete(OTPCode).where(OTPCode.user_id == user_id))
+            session.exec(delete(OTPCode).where(OTPCode.user_id == user_id), execution_options=bulk)
             
-            # 7. Finalmente, eliminar el usuario
-            session.delete(user)
+            # 7. Finalmente, eliminar el usuario (sin cargarlo antes)
+            result = session.exec(delete(User).where(User.id == user_id), execution_options=bulk)
+            UserService._invalidate_cached_user(session, user_id)
             
-            # Commit todas las eliminaciones
-            session.commit()
-            
-            return True
+            if result.rowcount == 0:
+                session.rollback()
+            else:
+                # Commit todas las eliminaciones
+                session.commit()
             
         except Exception as e:
             session.rollback()
@@ -557,4 +758,12 @@ class UserService:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error deleting account: {str(e)}"
             )
+        
+        if result.rowcount == 0:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        
+        return True
 
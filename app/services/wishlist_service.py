@@ -1,10 +1,15 @@
+import logging
 from sqlmodel import Session, select
+from sqlalchemy import exists
+from sqlalchemy.dialects.postgresql import insert
 from typing import List, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
 from fastapi import HTTPException, status
 from app.models import WishList, WishListCreate, Game
 from app.services.game_service import GameService
 
+logger = logging.getLogger(__name__)
+
 
 class WishListService:
     """Servicio para operaciones de WishList"""
@@ -18,37 +23,39 @@ class WishListService:
         game_id: int | None = None,
     ) -> List[Dict[str, Any]]:
         """Obtener wishlist de un usuario con datos completos del juego"""
-        statement = select(WishList).where(WishList.user_id == user_id)
+        # Un solo JOIN con solo las columnas de la respuesta (sin hidratar objetos ORM)
+        statement = (
+            select(
+                WishList.id,
+                WishList.game_id,
+                WishList.user_id,
+                WishList.url,
+                WishList.added_at,
+                Game.name.label("game_name"),
+                Game.genre.label("game_genre"),
+                Game.api_id.label("game_api_id"),
+                Game.description.label("game_description"),
+                Game.api_rating.label("game_api_rating"),
+                Game.cover_image.label("game_cover_image"),
+                Game.release_date.label("game_release_date"),
+                Game.platforms.label("game_platforms"),
+                Game.developer.label("game_developer"),
+                Game.publisher.label("game_publisher"),
+            )
+            .join(Game, Game.id == WishList.game_id)
+            .where(WishList.user_id == user_id)
+        )
 
         if game_id is not None:
             statement = statement.where(WishList.game_id == game_id)
 
         statement = statement.offset(skip).limit(limit)
         
-        wishlist_items = list(session.exec(statement).all())
-        
-        # Enriquecer con datos del juego
         result = []
-        for item in wishlist_items:
-            game = GameService.get_by_id(session, item.game_id)
-            if game:
-                result.append({
-                    "id": str(item.id),  # Convertir a string para evitar problemas de precisión en JavaScript
-                    "game_id": item.game_id,
-                    "user_id": item.user_id,
-                    "url": item.url,
-                    "added_at": item.added_at,
-                    "game_name": game.name,
-                    "game_genre": game.genre,
-                    "game_api_id": game.api_id,
-                    "game_description": game.description,
-                    "game_api_rating": game.api_rating,
-                    "game_cover_image": game.cover_image,
-                    "game_release_date": game.release_date,
-                    "game_platforms": game.platforms,
-                    "game_developer": game.developer,
-                    "game_publisher": game.publisher,
-                })
+        for row in session.exec(statement):
+            item = dict(row._mapping)
+            item["id"] = str(item["id"])  # Convertir a string para evitar problemas de precisión en JavaScript
+            result.append(item)
         
         return result
     
@@ -60,38 +67,35 @@ class WishListService:
     ) -> Dict[str, Any]:
         """Agregar juego a wishlist usando api_id"""
         # Buscar el juego por api_id en lugar de ID numérico
-        print(f"🔍 Buscando juego por api_id={wishlist_data.api_id}")
+        logger.debug("Buscando juego por api_id=%s", wishlist_data.api_id)
         game = GameService.get_by_api_id(session, wishlist_data.api_id)
         if not game:
-            print(f"❌ Juego con api_id={wishlist_data.api_id} NO encontrado")
+            logger.debug("Juego con api_id=%s no encontrado", wishlist_data.api_id)
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Game with api_id {wishlist_data.api_id} not found. Create it first."
             )
-        print(f"✅ Juego encontrado: {game.name} (ID={game.id}, api_id={game.api_id})")
+        logger.debug("Juego encontrado: %s (ID=%s, api_id=%s)", game.name, game.id, game.api_id)
         
-        # Verificar que no esté ya en wishlist (usar game.id que acabamos de obtener)
-        statement = select(WishList).where(
-            (WishList.user_id == user_id) &
-            (WishList.game_id == game.id)
-        )
-        existing = session.exec(statement).first()
+        # Insertar si no existe (INSERT ... ON CONFLICT DO NOTHING): la BD decide
+        # el duplicado de forma atómica, sin consulta previa
+        statement = insert(WishList).values(
+            user_id=user_id,
+            game_id=game.id,  # Usar el ID del juego encontrado
+            url=wishlist_data.url,
+            added_at=datetime.now(timezone.utc)
+        ).on_conflict_do_nothing(
+            index_elements=["user_id", "game_id"]
+        ).returning(WishList)
         
-        if existing:
+        wishlist_item = session.exec(statement).scalar_one_or_none()
+        if not wishlist_item:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Game already in wishlist"
             )
         
-        wishlist_item = WishList(
-            user_id=user_id,
-            game_id=game.id,  # Usar el ID del juego encontrado
-            url=wishlist_data.url
-        )
-        
-        session.add(wishlist_item)
         session.commit()
-        session.refresh(wishlist_item)
         
         # Retornar diccionario con ID como string para preservar precisión
         return {
@@ -154,12 +158,12 @@ class WishListService:
     
     @staticmethod
     def is_in_wishlist(session: Session, user_id: int, game_id: int) -> bool:
-        """Verificar si un juego está en wishlist"""
-        statement = select(WishList).where(
+        """Verificar si un juego está en wishlist (EXISTS: la BD corta en la primera fila)"""
+        statement = select(exists().where(
             (WishList.user_id == user_id) &
             (WishList.game_id == game_id)
-        )
-        return session.exec(statement).first() is not None
+        ))
+        return session.exec(statement).one()
     
     @staticmethod
     def get_common_wishlist_games(
@@ -182,18 +186,16 @@ class WishListService:
         if not common_game_ids:
             return []
         
-        # Obtener información completa de los juegos en común
-        result = []
-        for game_id in common_game_ids:
-            game = GameService.get_by_id(session, game_id)
-            if game:
-                result.append({
-                    "game_id": game.id,
-                    "game_name": game.name,
-                    "game_api_id": game.api_id,
-                    "game_cover_image": game.cover_image,
-                    "game_genre": game.genre,
-                    "game_api_rating": game.api_rating,
-                })
-        
-        return result
+        # Obtener información completa de los juegos en común (una sola consulta)
+        games = session.exec(select(Game).where(Game.id.in_(common_game_ids))).all()
+        return [
+            {
+                "game_id": game.id,
+                "game_name": game.name,
+                "game_api_id": game.api_id,
+                "game_cover_image": game.cover_image,
+                "game_genre": game.genre,
+                "game_api_rating": game.api_rating,
+            }
+            for game in games
+        ]